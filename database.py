@@ -5,7 +5,8 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
@@ -22,11 +23,18 @@ database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
 if database_url and database_name:
-    _client = MongoClient(database_url)
+    # One client per process, shared by every request; keep a few warm connections
+    # and let idle ones go after 30s. Each uvicorn worker imports this module itself.
+    _client = AsyncIOMotorClient(
+        database_url,
+        maxPoolSize=100,
+        minPoolSize=10,
+        maxIdleTimeMS=30000,
+    )
     db = _client[database_name]
 
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
+async def create_document(collection_name: str, data: Union[BaseModel, dict]):
     """Insert a single document with timestamp"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
@@ -40,10 +48,47 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     data_dict['created_at'] = datetime.now(timezone.utc)
     data_dict['updated_at'] = datetime.now(timezone.utc)
 
-    result = db[collection_name].insert_one(data_dict)
+    result = await db[collection_name].insert_one(data_dict)
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
+async def create_documents(collection_name: str, items: list):
+    """Insert many documents with timestamps in a single round trip
+
+    Returns (inserted_ids, write_errors). Each write error is a dict with the
+    failing document's index, the Mongo error code and its message.
+    """
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    if not items:
+        return [], []
+
+    now = datetime.now(timezone.utc)
+    docs = []
+    for data in items:
+        data_dict = data.model_dump() if isinstance(data, BaseModel) else data.copy()
+        data_dict['created_at'] = now
+        data_dict['updated_at'] = now
+        docs.append(data_dict)
+
+    # Unordered so one bad document does not stop the rest of the batch
+    try:
+        result = await db[collection_name].insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        write_errors = e.details.get("writeErrors") or []
+        if not write_errors:
+            raise
+        # insert_many assigns every _id client-side, so the survivors are known
+        failed = {err["index"] for err in write_errors}
+        inserted = [str(doc["_id"]) for i, doc in enumerate(docs) if i not in failed]
+        errors = [
+            {"index": err["index"], "code": err.get("code"), "message": err.get("errmsg")}
+            for err in write_errors
+        ]
+        return inserted, errors
+    return [str(_id) for _id in result.inserted_ids], []
+
+async def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
     """Get documents from collection"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
@@ -52,4 +97,4 @@ def get_documents(collection_name: str, filter_dict: dict = None, limit: int = N
     if limit:
         cursor = cursor.limit(limit)
     
-    return list(cursor)
+    return await cursor.to_list(length=limit)
@@ -1,20 +1,47 @@
+import asyncio
+import hashlib
+import logging
 import os
+import re
 import shutil
-import subprocess
-from typing import List, Optional
+import time
+from functools import lru_cache
+from typing import Annotated, Dict, List, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException
+import orjson
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-
-app = FastAPI()
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, Field, RootModel, StringConstraints
+
+# Importing database builds the Mongo client, which can also fail on a bad DATABASE_URL
+# or a DNS error; keep serving the non-database endpoints and report why instead.
+_db_import_error = None
+_db_module_missing = False
+try:
+    from database import create_document, create_documents, db, get_documents
+except Exception as e:
+    create_document = create_documents = get_documents = db = None
+    _db_import_error = str(e)
+    _db_module_missing = isinstance(e, ImportError)
+
+logger = logging.getLogger(__name__)
+
+app = FastAPI(default_response_class=ORJSONResponse)
+
+# Comma-separated list of frontend origins, e.g. "https://app.example.com,http://localhost:3000"
+CORS_ORIGINS = tuple(
+    origin.strip() for origin in os.getenv("CORS_ORIGINS", "*").split(",") if origin.strip()
+)
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_origins=CORS_ORIGINS,
+    allow_credentials=False,
+    allow_methods=("GET", "POST"),
+    allow_headers=("content-type", "if-none-match"),
+    # Let frontends read the ETag of cacheable responses and revalidate with it
+    expose_headers=("ETag",),
 )
 
 
@@ -30,6 +57,13 @@ class FirmwareIn(BaseModel):
     notes: Optional[str] = Field(None, description="Additional notes or changelog")
 
 
+FIRMWARE_BULK_MAX_ITEMS = 500
+
+
+class FirmwareBulkIn(RootModel[List[FirmwareIn]]):
+    root: List[FirmwareIn] = Field(..., max_length=FIRMWARE_BULK_MAX_ITEMS)
+
+
 class FirmwareFilter(BaseModel):
     model: Optional[str] = None
     soc: Optional[str] = None
@@ -53,25 +87,126 @@ class ConsentIn(BaseModel):
     )
 
 
+# Trimmed, lower-cased and checked by pydantic-core before the handler runs.
+# The pattern is matched before lower-casing, hence (?i).
+SocFamily = Annotated[
+    str,
+    StringConstraints(
+        strip_whitespace=True,
+        to_lower=True,
+        pattern=r"(?i)^(qualcomm|mtk|exynos)$",
+    ),
+]
+FlashMethod = Annotated[
+    str,
+    StringConstraints(
+        strip_whitespace=True,
+        to_lower=True,
+        pattern=r"(?i)^(fastboot|adb_sideload|odin|oneui_recovery)$",
+    ),
+]
+
+
 class WizardRequest(BaseModel):
-    soc: str = Field(..., description="qualcomm | mtk | exynos")
-    method: str = Field(..., description="fastboot | adb_sideload | odin | oneui_recovery")
-    model: Optional[str] = None
-    android_version: Optional[str] = None
+    soc: SocFamily = Field(..., description="qualcomm | mtk | exynos")
+    method: FlashMethod = Field(..., description="fastboot | adb_sideload | odin | oneui_recovery")
+    # Bounded because both are part of the wizard response cache key
+    model: Optional[str] = Field(None, max_length=64)
+    android_version: Optional[str] = Field(None, max_length=64)
+
+
+# Short-lived response caches for endpoints a UI tends to poll
+ADB_INFO_CACHE_TTL = 3.0
+_adb_info_cache = {"ts": 0.0, "val": None}
+
+# Collection names shown by /test, refreshed in the background instead of per request
+COLLECTIONS_REFRESH_SECONDS = 30.0
+_collections_cache = {"ts": 0.0, "val": None, "error": None, "task": None}
+
+_background_tasks = set()
+
+
+def _cached(cache: dict, ttl: float):
+    """Return the cached value if it is younger than ttl seconds, else None"""
+    if cache["val"] is not None and time.monotonic() - cache["ts"] < ttl:
+        return cache["val"]
+    return None
+
+
+def _store(cache: dict, val):
+    cache["ts"] = time.monotonic()
+    cache["val"] = val
+    return val
+
+
+def _spawn(coro):
+    """Run coro as a fire-and-forget task, keeping a reference until it finishes"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def _refresh_collections():
+    try:
+        _store(_collections_cache, await db.list_collection_names())
+        _collections_cache["error"] = None
+    except Exception as e:
+        _collections_cache["ts"] = time.monotonic()
+        _collections_cache["error"] = str(e)
+
+
+def _collections_refresh():
+    """Return the in-flight refresh task, starting one if none is running"""
+    task = _collections_cache["task"]
+    if task is None or task.done():
+        task = _collections_cache["task"] = _spawn(_refresh_collections())
+    return task
+
+
+@app.on_event("startup")
+async def load_collections():
+    if db is not None:
+        _collections_refresh()
+
+
+STATIC_CACHE_CONTROL = "public, max-age=300"
+
+
+def _etag(body: bytes) -> str:
+    return '"%s"' % hashlib.sha1(body).hexdigest()[:16]
+
+
+def _cacheable_json(request: Request, body: bytes, etag: str) -> Response:
+    """Serve a pre-serialized JSON body with validators, answering 304 on a matching If-None-Match"""
+    headers = {"ETag": etag, "Cache-Control": STATIC_CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (
+        if_none_match.strip() == "*"
+        or etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    ):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+ROOT_BODY = orjson.dumps({"message": "Hello from FastAPI Backend!"})
+ROOT_ETAG = _etag(ROOT_BODY)
+HELLO_BODY = orjson.dumps({"message": "Hello from the backend API!"})
+HELLO_ETAG = _etag(HELLO_BODY)
 
 
 @app.get("/")
-def read_root():
-    return {"message": "Hello from FastAPI Backend!"}
+def read_root(request: Request):
+    return _cacheable_json(request, ROOT_BODY, ROOT_ETAG)
 
 
 @app.get("/api/hello")
-def hello():
-    return {"message": "Hello from the backend API!"}
+def hello(request: Request):
+    return _cacheable_json(request, HELLO_BODY, HELLO_ETAG)
 
 
 @app.get("/test")
-def test_database():
+async def test_database():
     """Test endpoint to check if database is available and accessible"""
     response = {
         "backend": "✅ Running",
@@ -83,25 +218,31 @@ def test_database():
     }
 
     try:
-        from database import db
-
-        if db is not None:
+        if _db_module_missing:
+            response["database"] = "❌ Database module not found (run enable-database first)"
+        elif _db_import_error is not None:
+            response["database"] = f"❌ Error: {_db_import_error[:50]}"
+        elif db is not None:
             response["database"] = "✅ Available"
             response["database_url"] = "✅ Configured"
             response["database_name"] = db.name if hasattr(db, "name") else "✅ Connected"
             response["connection_status"] = "Connected"
 
-            try:
-                collections = db.list_collection_names()
-                response["collections"] = collections[:10]
+            if not _collections_cache["ts"]:
+                # Nothing known yet: wait for the (startup) refresh so the first answer is accurate.
+                # Shielded so a dropped request does not cancel the shared task.
+                await asyncio.shield(_collections_refresh())
+            elif time.monotonic() - _collections_cache["ts"] >= COLLECTIONS_REFRESH_SECONDS:
+                _collections_refresh()
+
+            if _collections_cache["error"] is None:
+                response["collections"] = _collections_cache["val"][:10]
                 response["database"] = "✅ Connected & Working"
-            except Exception as e:
-                response["database"] = f"⚠️  Connected but Error: {str(e)[:50]}"
+            else:
+                response["database"] = f"⚠️  Connected but Error: {_collections_cache['error'][:50]}"
         else:
             response["database"] = "⚠️  Available but not initialized"
 
-    except ImportError:
-        response["database"] = "❌ Database module not found (run enable-database first)"
     except Exception as e:
         response["database"] = f"❌ Error: {str(e)[:50]}"
 
@@ -111,13 +252,76 @@ def test_database():
     return response
 
 
+@app.get("/health")
+def health():
+    """Liveness probe; never touches the database"""
+    return {"status": "ok"}
+
+
 # -----------------------------
 # Device diagnostics (safe)
 # -----------------------------
+ADB_PROP_KEYS = (
+    "ro.product.brand",
+    "ro.product.device",
+    "ro.product.model",
+    "ro.build.id",
+    "ro.build.version.release",
+    "ro.build.version.sdk",
+    "ro.build.fingerprint",
+)
+# adb answers these in well under a second locally; fail fast instead of hanging a request
+ADB_DEVICES_TIMEOUT = 1.0
+ADB_GETPROP_TIMEOUT = 2.0
+# adb's location does not change while the process runs; resolve it once
+ADB_PATH = shutil.which("adb")
+# Single shell command reading every key, each value preceded by a __key__ marker line
+ADB_PROPS_CMD = "; ".join(f"echo __{key}__; getprop {key}" for key in ADB_PROP_KEYS)
+GETPROP_MARKER = re.compile(r"^__([\w.]+)__\r?$", re.MULTILINE)
+
+
+_adb_info_lock = asyncio.Lock()
+
+
 @app.get("/api/devices/adb-info")
-def adb_info():
+async def adb_info():
     """Return safe ADB environment info if available. Does not change device state."""
-    adb_path = shutil.which("adb")
+    cached = _cached(_adb_info_cache, ADB_INFO_CACHE_TTL)
+    if cached is None:
+        # Concurrent cache misses share one probe instead of each spawning adb
+        async with _adb_info_lock:
+            cached = _cached(_adb_info_cache, ADB_INFO_CACHE_TTL)
+            if cached is None:
+                try:
+                    cached = await _collect_adb_info()
+                except HTTPException as e:
+                    # Cache failures too, so pollers queued behind a hung adb reuse this one
+                    cached = e
+                _store(_adb_info_cache, cached)
+    if isinstance(cached, HTTPException):
+        raise HTTPException(status_code=cached.status_code, detail=cached.detail)
+    return cached
+
+
+async def _run_adb(*args: str, timeout: float) -> str:
+    """Run an adb command without blocking the event loop and return its stdout"""
+    proc = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        out, _ = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"'adb {args[1]}' timed out after {timeout} seconds") from None
+    finally:
+        # Timed out or cancelled: do not leave adb running behind us
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+    return out.decode(errors="replace")
+
+
+async def _collect_adb_info():
+    adb_path = ADB_PATH
     info = {
         "adb_available": bool(adb_path),
         "adb_path": adb_path,
@@ -127,40 +331,43 @@ def adb_info():
     if not adb_path:
         return info
 
+    # Both commands are read-only, so start getprop speculatively while listing devices
+    # _spawn keeps a reference, so a cancelled probe still gets to reap its adb child
+    getprop_task = _spawn(_run_adb(adb_path, "shell", ADB_PROPS_CMD, timeout=ADB_GETPROP_TIMEOUT))
     try:
-        out = subprocess.run([adb_path, "devices", "-l"], capture_output=True, text=True, timeout=5)
-        info["devices_raw"] = out.stdout
-        lines = [l.strip() for l in out.stdout.splitlines() if l.strip()]
-        for line in lines[1:]:  # skip header
-            info["devices"].append(line)
+        devices_out = await _run_adb(adb_path, "devices", "-l", timeout=ADB_DEVICES_TIMEOUT)
+    except TimeoutError as e:
+        getprop_task.cancel()
+        raise HTTPException(status_code=504, detail=f"ADB did not respond: {e}")
     except Exception as e:
+        devices_out = None
         info["errors"].append(str(e))
 
+    if devices_out is not None:
+        info["devices_raw"] = devices_out
+        lines = [l.strip() for l in devices_out.splitlines() if l.strip()]
+        for line in lines[1:]:  # skip header
+            info["devices"].append(line)
+
     # Best-effort read-only props for Android 14-16
     props = {}
     if not info["devices"]:
+        # No device, so the speculative getprop is irrelevant, even if it hangs
+        getprop_task.cancel()
         return {**info, "props": props}
 
     try:
-        getprop = subprocess.run([adb_path, "shell", "getprop"], capture_output=True, text=True, timeout=5)
-        for key in [
-            "ro.product.brand",
-            "ro.product.device",
-            "ro.product.model",
-            "ro.build.id",
-            "ro.build.version.release",
-            "ro.build.version.sdk",
-            "ro.build.fingerprint",
-        ]:
-            try:
-                gp = subprocess.run(
-                    [adb_path, "shell", "getprop", key], capture_output=True, text=True, timeout=5
-                )
-                props[key] = gp.stdout.strip()
-            except Exception:
-                props[key] = None
+        getprop_out = await getprop_task
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=f"ADB did not respond: {e}")
     except Exception as e:
         info["errors"].append(str(e))
+    else:
+        # split() yields ["", key1, value1, key2, value2, ...]
+        parts = GETPROP_MARKER.split(getprop_out)
+        found = {key: value.strip() for key, value in zip(parts[1::2], parts[2::2])}
+        for key in ADB_PROP_KEYS:
+            props[key] = found.get(key, "")
 
     return {**info, "props": props}
 
@@ -168,20 +375,56 @@ def adb_info():
 # -----------------------------
 # Firmware catalog management
 # -----------------------------
+async def _ensure_indexes():
+    """Create the indexes backing firmware search and consent lookups (idempotent)"""
+    try:
+        await db["firmware"].create_index([("model", 1), ("soc", 1), ("android_version", 1)])
+        await db["firmware"].create_index("soc")
+        await db["firmware"].create_index("android_version")
+        await db["consent"].create_index("customer_name")
+    except Exception as e:
+        logger.warning("Could not create MongoDB indexes: %s", e)
+
+
+@app.on_event("startup")
+async def create_indexes():
+    if db is None:
+        return
+    # Run in the background so an unreachable database does not hold up startup
+    _spawn(_ensure_indexes())
+
+
+def _require_database():
+    if _db_import_error is not None:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {_db_import_error}")
+
+
 @app.post("/api/firmware")
-def add_firmware(item: FirmwareIn):
+async def add_firmware(item: FirmwareIn):
+    _require_database()
     try:
-        from database import create_document
-        fid = create_document("firmware", item.model_dump())
+        fid = await create_document("firmware", item.model_dump(mode="python", exclude_none=True))
         return {"id": fid, "status": "saved"}
     except Exception as e:
         raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
 
 
+@app.post("/api/firmware/bulk")
+async def add_firmware_bulk(items: FirmwareBulkIn):
+    _require_database()
+    try:
+        ids, errors = await create_documents(
+            "firmware", [item.model_dump(mode="python", exclude_none=True) for item in items.root]
+        )
+        return {"ids": ids, "errors": errors, "status": "partial" if errors else "saved"}
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
+
+
 @app.post("/api/firmware/search")
-def search_firmware(filters: FirmwareFilter):
+async def search_firmware(filters: FirmwareFilter):
+    _require_database()
     try:
-        from database import get_documents
         query = {}
         if filters.model:
             query["model"] = filters.model
@@ -189,7 +432,7 @@ def search_firmware(filters: FirmwareFilter):
             query["soc"] = filters.soc
         if filters.android_version:
             query["android_version"] = filters.android_version
-        docs = get_documents("firmware", query, limit=100)
+        docs = await get_documents("firmware", query, limit=100)
         # Convert ObjectId if present
         for d in docs:
             if "_id" in d:
@@ -203,10 +446,10 @@ def search_firmware(filters: FirmwareFilter):
 # Consent and audit logging
 # -----------------------------
 @app.post("/api/consent")
-def record_consent(consent: ConsentIn):
+async def record_consent(consent: ConsentIn):
+    _require_database()
     try:
-        from database import create_document
-        cid = create_document("consent", consent.model_dump())
+        cid = await create_document("consent", consent.model_dump(mode="python", exclude_none=True))
         return {"id": cid, "status": "recorded"}
     except Exception as e:
         raise HTTPException(status_code=503, detail=f"Database unavailable: {str(e)}")
@@ -215,61 +458,89 @@ def record_consent(consent: ConsentIn):
 # -----------------------------
 # Instruction-only flashing wizard
 # -----------------------------
-@app.post("/api/wizard/steps")
-def wizard_steps(req: WizardRequest):
-    soc = (req.soc or "").lower()
-    method = (req.method or "").lower()
-
-    if soc not in {"qualcomm", "mtk", "exynos"}:
-        raise HTTPException(status_code=400, detail="Unsupported SoC")
-
-    steps: List[str] = []
-
-    if method == "fastboot":
-        steps = [
-            "Ensure OEM-unlocked bootloader if required by OEM; follow official guidance.",
-            "Charge device above 50% and back up user data.",
-            "Install official USB drivers and platform-tools.",
-            "Reboot device to bootloader/fastboot mode.",
-            "Use OEM-provided images matching exact model and Android version (14/15/16).",
-            "Validate SHA256 checksum from OEM before proceeding.",
-            "Use command-line fastboot to flash ONLY per OEM documentation.",
-            "After completion, relock bootloader only if OEM permits and device boots fine.",
-        ]
-    elif method in {"odin", "oneui_recovery"} and soc == "exynos":
-        steps = [
-            "Install latest Samsung USB drivers.",
-            "Download official firmware from Samsung channels (matching CSC and model).",
-            "Start device in Download Mode.",
-            "Open Odin on a trusted workstation, load BL/AP/CP/CSC as per OEM instructions.",
-            "Verify SHA256 checksums and binary revision (bootloader version).",
-            "Start process and wait until pass; do not disconnect.",
-            "On success, boot to recovery and wipe cache/data only if recommended by OEM.",
-        ]
-    elif method == "adb_sideload":
-        steps = [
-            "Enable USB debugging and OEM unlocking if applicable.",
-            "Download official OTA package for your exact model and Android version.",
-            "Reboot to recovery and choose 'Apply update from ADB'.",
-            "From workstation, run 'adb sideload <ota.zip>' per OEM guidance.",
-            "Wait for verification and installation to complete.",
-            "Reboot and perform post-update checks.",
-        ]
-    else:
+FASTBOOT_STEPS = (
+    "Ensure OEM-unlocked bootloader if required by OEM; follow official guidance.",
+    "Charge device above 50% and back up user data.",
+    "Install official USB drivers and platform-tools.",
+    "Reboot device to bootloader/fastboot mode.",
+    "Use OEM-provided images matching exact model and Android version (14/15/16).",
+    "Validate SHA256 checksum from OEM before proceeding.",
+    "Use command-line fastboot to flash ONLY per OEM documentation.",
+    "After completion, relock bootloader only if OEM permits and device boots fine.",
+)
+SAMSUNG_ODIN_STEPS = (
+    "Install latest Samsung USB drivers.",
+    "Download official firmware from Samsung channels (matching CSC and model).",
+    "Start device in Download Mode.",
+    "Open Odin on a trusted workstation, load BL/AP/CP/CSC as per OEM instructions.",
+    "Verify SHA256 checksums and binary revision (bootloader version).",
+    "Start process and wait until pass; do not disconnect.",
+    "On success, boot to recovery and wipe cache/data only if recommended by OEM.",
+)
+ADB_SIDELOAD_STEPS = (
+    "Enable USB debugging and OEM unlocking if applicable.",
+    "Download official OTA package for your exact model and Android version.",
+    "Reboot to recovery and choose 'Apply update from ADB'.",
+    "From workstation, run 'adb sideload <ota.zip>' per OEM guidance.",
+    "Wait for verification and installation to complete.",
+    "Reboot and perform post-update checks.",
+)
+
+# Keyed by (soc, method); "*" means the method applies to every supported SoC
+WIZARD_STEPS: Dict[Tuple[str, str], Tuple[str, ...]] = {
+    ("*", "fastboot"): FASTBOOT_STEPS,
+    ("*", "adb_sideload"): ADB_SIDELOAD_STEPS,
+    ("exynos", "odin"): SAMSUNG_ODIN_STEPS,
+    ("exynos", "oneui_recovery"): SAMSUNG_ODIN_STEPS,
+}
+SOC_SPECIFIC_METHODS = frozenset({"odin", "oneui_recovery"})
+WIZARD_DISCLAIMER = (
+    "Guidance only. Use official tools and firmware. This app does not execute flashing operations."
+)
+
+
+@lru_cache(maxsize=1024)
+def _wizard_body(
+    soc: str, method: str, model: Optional[str], android_version: Optional[str]
+) -> bytes:
+    """Serialized wizard response; a pure function of the request fields"""
+    key = (soc, method) if method in SOC_SPECIFIC_METHODS else ("*", method)
+    steps = WIZARD_STEPS.get(key)
+    if steps is None:
         raise HTTPException(status_code=400, detail="Unsupported method for selected SoC")
 
-    return {
-        "soc": soc,
-        "method": method,
-        "model": req.model,
-        "android_version": req.android_version,
-        "steps": steps,
-        "disclaimer": "Guidance only. Use official tools and firmware. This app does not execute flashing operations.",
-    }
+    return orjson.dumps(
+        {
+            "soc": soc,
+            "method": method,
+            "model": model,
+            "android_version": android_version,
+            "steps": steps,
+            "disclaimer": WIZARD_DISCLAIMER,
+        }
+    )
+
+
+@app.post("/api/wizard/steps")
+def wizard_steps(req: WizardRequest):
+    body = _wizard_body(req.soc, req.method, req.model, req.android_version)
+    return Response(content=body, media_type="application/json")
 
 
 if __name__ == "__main__":
     import uvicorn
 
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    if os.getenv("RELOAD", "").strip().lower() in ("1", "true", "yes", "on"):
+        # Development: single reloading process on uvicorn's defaults
+        uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True)
+    else:
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=port,
+            # "auto" picks uvloop/httptools when installed (uvloop is not available on Windows)
+            loop="auto",
+            http="auto",
+            workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        )